@@ -1,13 +1,21 @@
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
-from functools import lru_cache
+from functools import cached_property, lru_cache
 
 load_dotenv()
 
 
+def get_token_symbols(tokens_new) -> list[str]:
+    return [
+        token.split(" (")[1].replace("(", "").replace(")", "") for token in tokens_new
+    ]
+
+
 class ConfigSettings(BaseSettings):
     API_KEY: str = "string"
     CP_SECRET: str = "string"
+    # Seconds a CoinMarketCap response is reused for an identical ticker set (0 disables)
+    CMC_CACHE_TTL: int = 60
     DEFAULT_TOKENS_NEW: list[str] = [
         "DFI.Money (YFII)",
         "FIO Protocol (FIO)",
@@ -143,6 +151,11 @@ class ConfigSettings(BaseSettings):
         "Pump.fun (PUMP)"
     ]
 
+    @cached_property
+    def DEFAULT_TOKEN_SYMBOLS(self) -> list[str]:
+        # "Bitcoin (BTC)" -> "BTC", parsed once since get_settings() is cached
+        return get_token_symbols(self.DEFAULT_TOKENS_NEW)
+
 
 @lru_cache()
 def get_settings():
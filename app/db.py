@@ -1,41 +1,95 @@
+import atexit
 import sqlite3
+import threading
 from contextlib import contextmanager
+from typing import Iterable
 
 DB_FILE = "tickers.db"
+BUSY_TIMEOUT_MS = 3000
+CACHED_STATEMENTS = 256
+
+# Kept as constants so the connection's statement cache reuses the prepared statements
+SQL_INSERT = 'INSERT OR IGNORE INTO secret_tickers (secret, ticker) VALUES (?, ?)'
+SQL_SELECT = 'SELECT ticker FROM secret_tickers WHERE secret = ?'
+
+# Process-wide connection, opened by init_db() and shared by every request
+_CONN: sqlite3.Connection | None = None
+_LOCK = threading.Lock()
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
+    conn = sqlite3.connect(
+        DB_FILE,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=CACHED_STATEMENTS,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
     return conn
 
 def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS secret_tickers (
-            secret TEXT NOT NULL,
-            ticker TEXT NOT NULL,
-            PRIMARY KEY (secret, ticker)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    global _CONN
+    if _CONN is not None:
+        return _CONN
+
+    # Request threads may get here concurrently; only one of them opens the connection
+    with _LOCK:
+        if _CONN is not None:
+            return _CONN
+
+        conn = get_db_connection()
+        # journal_mode=WAL is persisted in the database file; the rest are per-connection
+        conn.executescript(f'''
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA mmap_size=268435456;
+            PRAGMA cache_size=-65536;
+            PRAGMA busy_timeout={BUSY_TIMEOUT_MS};
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS secret_tickers (
+                secret TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                PRIMARY KEY (secret, ticker)
+            )
+        ''')
+        # The (secret, ticker) primary key already gives SQL_SELECT a covering index:
+        # SEARCH secret_tickers USING COVERING INDEX sqlite_autoindex_secret_tickers_1 (secret=?)
+        _CONN = conn
+        return conn
+
+def close_db():
+    global _CONN
+    with _LOCK:
+        if _CONN is not None:
+            _CONN.close()
+            _CONN = None
+
+atexit.register(close_db)
 
 def add_ticker(secret: str, ticker: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute('INSERT OR IGNORE INTO secret_tickers (secret, ticker) VALUES (?, ?)', (secret, ticker))
-        conn.commit()
-    finally:
-        conn.close()
+    conn = init_db()
+    with _LOCK:
+        conn.execute(SQL_INSERT, (secret, ticker))
+
+def add_tickers_bulk(secret: str, tickers: Iterable[str]):
+    rows = [(secret, ticker) for ticker in tickers]
+    if not rows:
+        return
+    conn = init_db()
+    with _LOCK:
+        # One explicit transaction so the whole batch pays a single commit
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(SQL_INSERT, rows)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
 
 def get_tickers(secret: str) -> list[str]:
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute('SELECT ticker FROM secret_tickers WHERE secret = ?', (secret,))
-        rows = cursor.fetchall()
-        return [row['ticker'] for row in rows]
-    finally:
-        conn.close()
+    conn = init_db()
+    with _LOCK:
+        rows = conn.execute(SQL_SELECT, (secret,)).fetchall()
+    return [row['ticker'] for row in rows]
@@ -1,19 +1,24 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
+from datetime import datetime
+from itertools import chain
 from typing import Annotated
 
 import uvicorn
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request
 from fastapi.exceptions import HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
 
 from app.config import get_settings
-from app.db import add_ticker, get_tickers, init_db
+from app.db import add_tickers_bulk, get_tickers, init_db
 from app.utils import (
+    TIMESTAMP_FORMAT,
     build_crypto_table,
+    create_http_session,
     fetch_crypto_data,
-    get_token_symbols,
+    parse_tickers,
     zip_csv_and_xlsx,
 )
 from app.validators import TableFieldsAndTickers, V2DownloadRequest
@@ -35,7 +40,9 @@ SETTINGS = get_settings()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    app.state.http = create_http_session()
     yield
+    await app.state.http.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -55,32 +62,30 @@ async def root():
 
 
 @app.get("/api/data/download")
-async def get_data(filterParams: Annotated[TableFieldsAndTickers, Query()]):
-    from datetime import datetime
-
-    logger.info("=" * 50)
-    logger.info("API v1 /api/data/download called")
+async def get_data(
+    request: Request, filterParams: Annotated[TableFieldsAndTickers, Query()]
+):
     body = filterParams
-    logger.info(f"Request params: {body.model_dump()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("API v1 request params: %s", body.model_dump())
 
     if body.tickers == SETTINGS.CP_SECRET:
-        tickers = get_token_symbols(SETTINGS.DEFAULT_TOKENS_NEW)
-        logger.info(f"Secret matched - using default tokens: {tickers}")
+        tickers = SETTINGS.DEFAULT_TOKEN_SYMBOLS
+        logger.debug("Secret matched - using default tokens: %s", tickers)
     elif body.tickers == None:
         tickers = "BTC,ETH,PI"
-        logger.info(f"No tickers provided - using default: {tickers}")
+        logger.debug("No tickers provided - using default: %s", tickers)
     else:
         tickers = body.tickers
-        logger.info(f"Using provided tickers: {tickers}")
+        logger.debug("Using provided tickers: %s", tickers)
 
     try:
         # Generate timestamp for this download
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
 
-        data = await fetch_crypto_data(tickers)
+        data = await fetch_crypto_data(tickers, request.app.state.http)
         data = build_crypto_table(data, body)
         zipfile = zip_csv_and_xlsx(data, timestamp)
-        logger.info("Successfully created zip file")
 
         filename = f"crypto_data_{timestamp}.zip"
         return Response(
@@ -95,79 +100,69 @@ async def get_data(filterParams: Annotated[TableFieldsAndTickers, Query()]):
 
 
 @app.get("/api/v2/data/download")
-async def get_data_v2(filterParams: Annotated[V2DownloadRequest, Query()]):
-    from datetime import datetime
-
-    logger.info("=" * 50)
-    logger.info("API v2 /api/v2/data/download called")
+async def get_data_v2(
+    request: Request, filterParams: Annotated[V2DownloadRequest, Query()]
+):
     body = filterParams
     secret = body.secret
-    logger.info(f"Request params: {body.model_dump()}")
-    logger.info(f"Secret provided: {secret is not None}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("API v2 request params: %s", body.model_dump(exclude={"secret"}))
 
     # Logic to gather tickers
-    final_tickers = []
+    default_tokens = ()
+    persisted = ()
     new_tickers = []
+    provided_tickers = parse_tickers(body.tickers) if body.tickers else []
 
     # 1. Defaults from Secret
     if secret == SETTINGS.CP_SECRET:
-        default_tokens = get_token_symbols(SETTINGS.DEFAULT_TOKENS_NEW)
-        final_tickers.extend(default_tokens)
-        logger.info(f"Secret matched - added default tokens: {default_tokens}")
+        default_tokens = SETTINGS.DEFAULT_TOKEN_SYMBOLS
+        logger.debug("Secret matched - added %d default tokens", len(default_tokens))
 
     # 2. Persisted Tickers
     if secret:
         # If tickers provided in request, add to DB
         if body.tickers:
-            # allow comma separated
-            new_tickers = [t.strip() for t in body.tickers.replace(" ", "").split(",") if t.strip()]
-            logger.info(
-                f"Adding {len(new_tickers)} new tickers to DB for secret: {new_tickers}"
-            )
+            new_tickers = provided_tickers
+            logger.debug("Adding %d new tickers to DB for secret: %s", len(new_tickers), new_tickers)
 
         # Fetch all persisted
-        persisted = get_tickers(secret)
-        logger.info(
-            f"Retrieved {len(persisted)} persisted tickers for secret: {persisted}"
-        )
-        final_tickers.extend(persisted)
+        persisted = await asyncio.to_thread(get_tickers, secret)
+        logger.debug("Retrieved %d persisted tickers for secret", len(persisted))
 
     # 3. Fallback / No Secret case
     if not secret:
         if body.tickers:
-            provided_tickers = [t.strip() for t in body.tickers.split(",") if t.strip()]
-            final_tickers.extend(provided_tickers)
-            logger.info(f"No secret - using provided tickers: {provided_tickers}")
+            logger.debug("No secret - using provided tickers: %s", provided_tickers)
         else:
-            final_tickers = ["BTC", "ETH", "PI"]
-            logger.info(f"No secret, no tickers - using defaults: {final_tickers}")
+            provided_tickers = ["BTC", "ETH", "PI"]
+            logger.debug("No secret, no tickers - using defaults: %s", provided_tickers)
 
     # Deduplicate and clean
-    # If final_tickers is empty at this point, maybe fallback?
+    # If nothing was gathered at this point, maybe fallback?
     # But if secret was used and had no tickers, effectively empty list.
     # Assuming user wants at least something if explicit tickers provided.
 
-    final_tickers.extend(new_tickers)
-    unique_tickers = list(dict.fromkeys(final_tickers))  # preserve order
+    # Newly provided tickers go last; dict.fromkeys preserves first-seen order
+    unique_tickers = list(dict.fromkeys(chain(default_tokens, persisted, provided_tickers)))
     if not unique_tickers:
         unique_tickers = ["BTC", "ETH", "PI"]
         logger.warning("No tickers found - using fallback defaults: BTC, ETH, PI")
 
     tickers_str = ",".join(unique_tickers)
-    logger.info(f"Final unique tickers ({len(unique_tickers)}): {tickers_str}")
+    logger.info("Final unique tickers (%d): %s", len(unique_tickers), tickers_str)
 
     try:
         # Generate timestamp for this download
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
 
-        data = await fetch_crypto_data(tickers_str)
-        for t in new_tickers:
-            add_ticker(secret, t)
+        data = await fetch_crypto_data(tickers_str, request.app.state.http)
+        if new_tickers:
+            await asyncio.to_thread(add_tickers_bulk, secret, new_tickers)
         # Note: build_crypto_table takes 'body' which is TableFieldsAndTickers (or subclass)
         # It uses the fields to determine columns. V2DownloadRequest has them.
         data = build_crypto_table(data, body)
         zipfile = zip_csv_and_xlsx(data, timestamp)
-        logger.info("Successfully created zip file for v2 endpoint")
 
         filename = f"crypto_data_v2_{timestamp}.zip"
         return Response(
@@ -1,13 +1,17 @@
 import aiohttp
 import asyncio
+from cachetools import TTLCache
 from app.validators import TableFieldsAndTickers
 import io
+import orjson
 import pandas as pd
 import zipfile
+from datetime import datetime
 from fastapi.exceptions import HTTPException
 import logging
+import re
 
-from .config import get_settings
+from .config import get_settings, get_token_symbols
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +20,9 @@ logger = logging.getLogger(__name__)
 SETTINGS = get_settings()
 api_key = SETTINGS.API_KEY
 
+# Used for download folder and file names, e.g. "2025-12-18_15-14-38"
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
 def get_amount_abbrv(price: int) -> int:
     # if price is None:
     #     return None
@@ -34,121 +41,163 @@ def get_amount_abbrv(price: int) -> int:
     return price
 
 
-def get_token_symbols(tokens_new) -> list[str]:
-    return [
-        token.split(" (")[1].replace("(", "").replace(")", "") for token in tokens_new
-    ]
+# Table column for each optional model field, in the model's field order
+FIELD_TO_COLUMN = {
+    "price": "Price",
+    "market_cap": "Market Cap",
+    "market_cap_abbrv": "Market Cap Abbrv",
+    "volume_24h": "Volume(24h)",
+    "total_supply": "Total Supply",
+    "circulating_supply": "Circulating Supply",
+    "supply_percent": "Supply %",
+    "volume_change_24h": "Volume Change(24h)",
+    "token_address": "Token Address",
+    "market_cap_dominance": "Market Cap Dominance",
+}
 
+# Raw columns pulled from each CoinMarketCap entry, before derived columns are added
+RECORD_COLUMNS = [
+    "Name",
+    "Symbol",
+    "Price",
+    "Token Address",
+    "Market Cap",
+    "Market Cap Dominance",
+    "Volume(24h)",
+    "Circulating Supply",
+    "Total Supply",
+    "Volume Change(24h)",
+]
 
-async def fetch_crypto_data(symbols: str | list[str])-> dict:
-    logger.info(f"Fetching crypto data for symbols: {symbols}")
-    async with aiohttp.ClientSession() as session:
-        url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
-        headers = {"Accepts": "application/json", "X-CMC_PRO_API_KEY": api_key}
-        if isinstance(symbols, list):
-            params = {"symbol": ",".join(symbols)}
-        else:
-            params = {"symbol": symbols}
-        
-        logger.info(f"API Request params: {params}")
-        async with session.get(url, headers=headers, params=params) as response:
-            if response.status not in [200, 201]:
-                error_detail = await response.json()
-                logger.error(f"API Error (status {response.status}): {error_detail}")
-                raise HTTPException(
-                   status_code=response.status,
-                   detail=error_detail,
-               )
-        
-            result = await response.json()
-            logger.info(f"API Response received. Data keys: {list(result.get('data', {}).keys())}")
-            return result
+
+_TICKER_SPLIT_RE = re.compile(r"[,\s]+")
+
+
+def parse_tickers(tickers: str) -> list[str]:
+    """Split a comma (and/or whitespace) separated ticker string, dropping empty entries."""
+    return list(filter(None, _TICKER_SPLIT_RE.split(tickers)))
+
+
+CMC_QUOTES_URL = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """
+    Create the CoinMarketCap client session shared by all requests.
+
+    Keeping one session alive reuses pooled keep-alive connections (and their TLS
+    handshakes) instead of reconnecting on every download.
+    """
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=50, ttl_dns_cache=300),
+        headers={"Accepts": "application/json", "X-CMC_PRO_API_KEY": api_key},
+    )
+
+
+# Parsed CoinMarketCap responses keyed by the sorted ticker set
+_QUOTES_CACHE: TTLCache = TTLCache(maxsize=128, ttl=SETTINGS.CMC_CACHE_TTL)
+# Upstream calls currently running, so concurrent misses for a key share one call
+_QUOTES_IN_FLIGHT: dict[tuple[str, ...], asyncio.Task] = {}
+
+
+def _quotes_cache_key(symbols: str | list[str]) -> tuple[str, ...]:
+    if isinstance(symbols, str):
+        symbols = symbols.split(",")
+    return tuple(sorted(set(symbols)))
+
+
+async def fetch_crypto_data(symbols: str | list[str], session: aiohttp.ClientSession) -> dict:
+    key = _quotes_cache_key(symbols)
+    result = _QUOTES_CACHE.get(key)
+    if result is not None:
+        logger.debug("Using cached crypto data for symbols: %s", symbols)
+        return result
+
+    task = _QUOTES_IN_FLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_and_cache(key, symbols, session))
+        _QUOTES_IN_FLIGHT[key] = task
+        task.add_done_callback(lambda done: _forget_in_flight(key, done))
+
+    # Every waiter gets the same result or exception; shield so one cancelled
+    # request doesn't cancel the call the others are waiting on
+    return await asyncio.shield(task)
+
+
+async def _fetch_and_cache(key: tuple[str, ...], symbols: str | list[str], session: aiohttp.ClientSession) -> dict:
+    result = await _request_crypto_data(symbols, session)
+    _QUOTES_CACHE[key] = result
+    return result
+
+
+def _forget_in_flight(key: tuple[str, ...], task: asyncio.Task):
+    if _QUOTES_IN_FLIGHT.get(key) is task:
+        del _QUOTES_IN_FLIGHT[key]
+    # Mark a failure as retrieved in case every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+async def _request_crypto_data(symbols: str | list[str], session: aiohttp.ClientSession) -> dict:
+    logger.info("Fetching crypto data for symbols: %s", symbols)
+    if isinstance(symbols, list):
+        params = {"symbol": ",".join(symbols)}
+    else:
+        params = {"symbol": symbols}
+
+    async with session.get(CMC_QUOTES_URL, params=params) as response:
+        if response.status not in [200, 201]:
+            error_detail = await response.json(loads=orjson.loads)
+            logger.error(f"API Error (status {response.status}): {error_detail}")
+            raise HTTPException(
+               status_code=response.status,
+               detail=error_detail,
+           )
+
+        result = await response.json(loads=orjson.loads)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("API Response received. Data keys: %s", list(result.get("data", {}).keys()))
+        return result
 
 
 def build_crypto_table(data, model: TableFieldsAndTickers = TableFieldsAndTickers()):
-    logger.info("Building crypto table...")
-    logger.info(f"Model fields: {model.model_dump()}")
-    
-    crypto_table = {
-        "Name": [],
-        "Symbol": [],
-    }
+    # Read the flags straight off the model; model_dump() would rebuild the whole dict
+    enabled_fields = [field for field in FIELD_TO_COLUMN if getattr(model, field)]
+    columns = ["Name", "Symbol", *(FIELD_TO_COLUMN[field] for field in enabled_fields)]
 
-    field_dictionary = model.model_dump(exclude_none=True)
-    logger.info(f"Enabled fields: {[k for k, v in field_dictionary.items() if v != False and k not in ['tickers', 'secret']]}")
-    
-    for key in field_dictionary.keys():
-        if field_dictionary[key] != False and key not in ["tickers", "secret"]:
-            if key == "supply_percent":
-                crypto_table["Supply %"] = []
-            elif key == "volume_change_24h":
-                crypto_table["Volume Change(24h)"] = []
-            elif key == "volume_24h":
-                crypto_table["Volume(24h)"] = []
-            else:
-                formated_key = key.replace("_", " ").title()
-                crypto_table[formated_key] = []
-    
-    logger.info(f"Initialized table columns: {list(crypto_table.keys())}")
-    logger.info(f"Number of cryptos in response: {len(data.get('data', {}))}")
-    
-    crypto_count = 0
-    skipped_count = 0
-    
-    for symbol, crypto in data["data"].items():
-        logger.debug(f"Processing crypto: {symbol} - {crypto.get('name')}")
-        
-        # FIXED: The bug was here - this condition would skip adding to some arrays but not all
-        # Removing this faulty logic - if price is not requested, we just don't add it to the table
-        # But we should still process the crypto entry
-        # if not model.price and crypto.get("quote", {}).get("USD", {}).get("price"):
-        #     continue
-        
-        crypto_table["Name"].append(crypto.get("name"))
-        crypto_table["Symbol"].append(crypto.get("symbol"))
+    # One flat record per crypto; derived columns are computed on whole columns below
+    records = []
+    for crypto in data["data"].values():
         quote = crypto.get("quote", {}).get("USD", {})
-        
-        if model.price:
-            crypto_table["Price"].append(quote.get("price"))
-        if model.token_address:
-            crypto_table["Token Address"].append(crypto.get("token_address"))
-        if model.market_cap_abbrv:
-            crypto_table["Market Cap Abbrv"].append(get_amount_abbrv(quote.get("market_cap")))
-        if model.market_cap:
-            crypto_table["Market Cap"].append(quote.get("market_cap"))
-        if model.market_cap_dominance:
-            crypto_table["Market Cap Dominance"].append(quote.get("market_cap_dominance"))
-        if model.volume_24h:
-            crypto_table["Volume(24h)"].append(quote.get("volume_24h"))
-        if model.circulating_supply:
-            crypto_table["Circulating Supply"].append(crypto.get("circulating_supply"))
-        if model.total_supply:
-            crypto_table["Total Supply"].append(crypto.get("total_supply"))
-        if model.volume_change_24h:
-            crypto_table["Volume Change(24h)"].append(quote.get("volume_change_24h"))
-        if model.supply_percent:
-            circ = crypto.get("circulating_supply", 0)
-            total = crypto.get("total_supply", 0)
-            crypto_table["Supply %"].append(
-                round((circ / total) * 100, 2) if total else "N/A"
-            )
-        
-        crypto_count += 1
-    
-    logger.info(f"Processed {crypto_count} cryptos, skipped {skipped_count}")
-    
-    # Log array lengths before creating DataFrame
-    array_lengths = {key: len(value) for key, value in crypto_table.items()}
-    logger.info(f"Array lengths: {array_lengths}")
-    
-    # Check if all arrays have the same length
-    lengths = set(array_lengths.values())
-    if len(lengths) > 1:
-        logger.error(f"CRITICAL: Array length mismatch detected! Lengths: {array_lengths}")
-        raise ValueError(f"All arrays must be of the same length. Got: {array_lengths}")
-    
-    logger.info(f"Creating DataFrame with {crypto_count} rows and {len(crypto_table)} columns")
-    return pd.DataFrame(crypto_table)
+        records.append(
+            {
+                "Name": crypto.get("name"),
+                "Symbol": crypto.get("symbol"),
+                "Price": quote.get("price"),
+                "Token Address": crypto.get("token_address"),
+                "Market Cap": quote.get("market_cap"),
+                "Market Cap Dominance": quote.get("market_cap_dominance"),
+                "Volume(24h)": quote.get("volume_24h"),
+                "Circulating Supply": crypto.get("circulating_supply"),
+                "Total Supply": crypto.get("total_supply"),
+                "Volume Change(24h)": quote.get("volume_change_24h"),
+            }
+        )
+
+    df = pd.DataFrame.from_records(records, columns=RECORD_COLUMNS)
+    # Derived columns are only computed when the request asks for them
+    if model.market_cap_abbrv:
+        df["Market Cap Abbrv"] = df["Market Cap"].map(get_amount_abbrv)
+
+    if model.supply_percent:
+        circ = pd.to_numeric(df["Circulating Supply"], errors="coerce").fillna(0)
+        total = pd.to_numeric(df["Total Supply"], errors="coerce").fillna(0)
+        has_total = total != 0
+        supply_percent = (circ / total.where(has_total) * 100).round(2)
+        df["Supply %"] = supply_percent.astype(object).where(has_total, "N/A")
+
+    logger.debug("Built crypto table with %d rows and columns %s", len(df), columns)
+    return df[columns]
 
 
 def zip_csv_and_xlsx(dataframe: pd.DataFrame, timestamp: str = None) -> bytes:
@@ -159,14 +208,14 @@ def zip_csv_and_xlsx(dataframe: pd.DataFrame, timestamp: str = None) -> bytes:
         dataframe: The pandas DataFrame to export
         timestamp: Optional timestamp string for naming files (e.g., "2025-12-18_15-14-38")
     """
-    from datetime import datetime
-    
     # Generate timestamp if not provided
     if timestamp is None:
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
     
-    logger.info(f"Creating zip file with timestamp: {timestamp}")
+    logger.debug("Creating zip file with timestamp: %s", timestamp)
     
+    sorted_df = dataframe.sort_values(by="Name", ascending=False)
+
     zip_file = io.BytesIO()
     with zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) as zip:
         
@@ -174,21 +223,21 @@ def zip_csv_and_xlsx(dataframe: pd.DataFrame, timestamp: str = None) -> bytes:
         folder_name = f"crypto_data_{timestamp}"
         
         # write dataframe to excel file
+        # xlsxwriter builds its own zip archive, so hand its buffer over without copying;
+        # XLSX is already deflated, so store it as-is instead of compressing it twice
         xlsx_file = io.BytesIO()
-        dataframe.sort_values(by="Name", ascending=False).to_excel(
-            xlsx_file, index=False
-        )
-        
-        #write dataframe to csv file
-        csv_file = io.BytesIO()
-        dataframe.sort_values(by="Name", ascending=False).to_csv(
-            csv_file, index=False
-        )
-        
-        # Write files inside timestamped folder
-        zip.writestr(f"{folder_name}/crypto_data_{timestamp}.xlsx", xlsx_file.getvalue())
-        zip.writestr(f"{folder_name}/crypto_data_{timestamp}.csv", csv_file.getvalue())
+        sorted_df.to_excel(xlsx_file, index=False, engine="xlsxwriter")
+        with xlsx_file.getbuffer() as xlsx_bytes:
+            zip.writestr(
+                f"{folder_name}/crypto_data_{timestamp}.xlsx",
+                xlsx_bytes,
+                compress_type=zipfile.ZIP_STORED,
+            )
+
+        # write dataframe to csv file, streamed straight into the zip entry
+        with zip.open(f"{folder_name}/crypto_data_{timestamp}.csv", "w") as csv_file:
+            sorted_df.to_csv(csv_file, index=False)
     
-    logger.info(f"Zip created with folder: {folder_name}")
+    logger.debug("Zip created with folder: %s", folder_name)
     
     return zip_file.getvalue()